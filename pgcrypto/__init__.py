@@ -12,7 +12,7 @@
 #
 # See http://www.ietf.org/rfc/rfc2440.txt for ASCII Armor specs.
 
-from .base import __version__, __version_info__, aes_pad_key, armor, dearmor, pad, unpad
+from .base import __version__, __version_info__, aes_pad_key, armor, dearmor, pad, pad_inplace, unpad
 
 
 try:
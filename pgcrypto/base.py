@@ -2,12 +2,28 @@ __version__ = '1.4.0'
 __version_info__ = (int(v) for v in __version__.split('.'))
 
 import base64
+import re
 import struct
 
 
 CRC24_INIT = 0xB704CE
 CRC24_POLY = 0x1864CFB
 
+# Matches the armor produced by armor() below (and by pgcrypto's armor
+# function): optional header lines, a blank line, the base64 body (possibly
+# wrapped over several lines), and the checksum line. Compiled once so dearmor
+# can grab everything in a single C-level pass instead of looping over lines.
+ARMOR_RE = re.compile(
+    r'-----BEGIN PGP MESSAGE-----\n'
+    r'(?:[^\n]+\n)*'
+    r'\n'
+    r'(?P<body>[A-Za-z0-9+/=\s]+?)\n'
+    r'=(?P<crc>[A-Za-z0-9+/]{4})\s*\n'
+    r'-----END PGP MESSAGE-----')
+
+# Translation table deleting any whitespace from the (multi-line) base64 body.
+B64_STRIP_WHITESPACE = {ord(c): None for c in ' \t\r\n'}
+
 
 class BadChecksumError (Exception):
     pass
@@ -53,6 +69,28 @@ def dearmor(text, verify=True):
     of the decoded data, otherwise it is ignored. If the checksum does not
     match, a BadChecksumError exception is raised.
     """
+    match = ARMOR_RE.search(text)
+    if match:
+        b64_str = match.group('body').translate(B64_STRIP_WHITESPACE)
+        check_data = match.group('crc').encode('ascii')
+    else:
+        # Nonstandard armor (e.g. missing checksum line); parse line by line.
+        b64_str, check_data = _dearmor_lines(text)
+    # Python 3's b64decode expects bytes, not a string. We know base64 is ASCII, though.
+    data = base64.b64decode(b64_str.encode('ascii'))
+    if verify and check_data:
+        # The 24-bit CRC is in big-endian, so we add a null byte to the beginning.
+        crc = struct.unpack('>L', b'\0' + base64.b64decode(check_data))[0]
+        if crc != crc24(data):
+            raise BadChecksumError()
+    return data
+
+
+def _dearmor_lines(text):
+    """
+    Line-by-line armor parsing, returning the joined base64 body and the raw
+    checksum data (or None if there was no checksum line).
+    """
     lines = text.strip().split('\n')
     data_lines = []
     check_data = None
@@ -79,15 +117,7 @@ def dearmor(text, verify=True):
                 else:
                     # The data starts after an empty line.
                     in_body = True
-    b64_str = ''.join(data_lines)
-    # Python 3's b64decode expects bytes, not a string. We know base64 is ASCII, though.
-    data = base64.b64decode(b64_str.encode('ascii'))
-    if verify and check_data:
-        # The 24-bit CRC is in big-endian, so we add a null byte to the beginning.
-        crc = struct.unpack('>L', b'\0' + base64.b64decode(check_data))[0]
-        if crc != crc24(data):
-            raise BadChecksumError()
-    return data
+    return ''.join(data_lines), check_data
 
 
 def unpad(text, block_size):
@@ -104,9 +134,10 @@ def unpad(text, block_size):
     if padch > block_size:
         # If the last byte value is larger than the block size, it's not padded.
         return text
-    while end > 0 and ord_safe(text[end - 1]) in (0, padch):
-        end -= 1
-    return text[:end]
+    # Strip both candidate pad bytes in a single C-level rstrip, rather than
+    # branching on every byte in a Python loop.
+    strip_chars = bytes((0, padch)) if isinstance(text, bytes) else '\0' + chr(padch)
+    return text.rstrip(strip_chars)
 
 
 def pad(text, block_size, zero=False):
@@ -120,6 +151,17 @@ def pad(text, block_size, zero=False):
     return text + (ch * num)
 
 
+def pad_inplace(buf, block_size, zero=False):
+    """
+    Like pad, but appends the padding bytes to the given bytearray in place,
+    avoiding the full-size copy the concatenation in pad incurs. Returns the
+    same bytearray for convenience.
+    """
+    num = block_size - (len(buf) % block_size)
+    buf.extend(b'\0' * num if zero else bytes((num,)) * num)
+    return buf
+
+
 def aes_pad_key(key):
     """
     AES keys must be either 16, 24, or 32 bytes long. If a key is provided that is not
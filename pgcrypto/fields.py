@@ -1,16 +1,117 @@
 from django import forms
 from django.conf import settings
 from django.core import validators
+from django.core.exceptions import ImproperlyConfigured
 from django.db import models
+from django.db.models.functions import Cast
 from django.utils import six, timezone
 from django.utils.encoding import force_text, force_bytes
 from django.utils.translation import ugettext_lazy as _
 import django
 
-from .base import aes_pad_key, armor, dearmor, pad, unpad
+from Cryptodome.Cipher import AES, Blowfish
+
+from .base import aes_pad_key, armor, dearmor, unpad
 
 import datetime
 import decimal
+import functools
+import os
+
+
+# Armored values always start with the BEGIN marker; comparing a fixed-size
+# slice against this precomputed constant keeps is_encrypted O(1) no matter
+# how large the value is.
+_ARMOR_PREFIX = '-----BEGIN'
+
+# pgcrypto always uses a zeroed IV; one shared constant per block size.
+_ZERO_IVS = {
+    8: b'\0' * 8,
+    16: b'\0' * 16,
+}
+
+# Derived AES keys, shared across field instances. Real deployments use only
+# a handful of keys, so a small bound keeps pathological key churn from
+# growing the cache while typical projects always hit it.
+_AES_KEY_CACHE = {}
+_AES_KEY_CACHE_SIZE = 16
+
+# The ciphers pgcrypto's encrypt/decrypt functions support out of the box.
+# Resolved once at import time so field construction is a plain dict lookup.
+_CIPHER_CLASSES = {
+    'AES': AES,
+    'Blowfish': Blowfish,
+}
+
+# Optional OpenSSL EVP backend (settings.PGCRYPTO_BACKEND = 'cryptography'),
+# which guarantees runtime AES-NI dispatch regardless of how Cryptodome was built.
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher as EVPCipher, algorithms as evp_algorithms, modes as evp_modes
+    # Newer cryptography releases drop legacy ciphers (notably Blowfish) from
+    # algorithms, so look each one up defensively; the shape of an optional
+    # dependency must never break importing this module.
+    _EVP_ALGORITHMS = {
+        name: algorithm
+        for name, algorithm in (
+            ('AES', getattr(evp_algorithms, 'AES', None)),
+            ('Blowfish', getattr(evp_algorithms, 'Blowfish', None)),
+        )
+        if algorithm is not None
+    }
+except ImportError:
+    _EVP_ALGORITHMS = None
+
+
+class _EVPCipherAdapter (object):
+    """
+    Wraps a cryptography (OpenSSL EVP) Cipher object in the minimal
+    encrypt/decrypt interface the fields expect from a Cryptodome cipher.
+    The master EVP context is built once per key; each operation spawns a
+    fresh encryptor/decryptor, which OpenSSL implements as a cheap context
+    copy, so the zeroed IV is re-applied for every message.
+    """
+
+    def __init__(self, evp_cipher):
+        self._evp_cipher = evp_cipher
+
+    def encrypt(self, data):
+        ctx = self._evp_cipher.encryptor()
+        return ctx.update(data) + ctx.finalize()
+
+    def decrypt(self, data):
+        ctx = self._evp_cipher.decryptor()
+        return ctx.update(data) + ctx.finalize()
+
+
+class CipherSession (object):
+    """
+    A lightweight handle on a field's specialized encrypt/decrypt closures,
+    for callers processing many values in a row: all cipher setup is bound
+    once when the session is created and shared across every call, and a key
+    rebind on the field mid-batch cannot swap the cipher out from under the
+    caller. Usable directly or as a context manager.
+    """
+
+    def __init__(self, field):
+        self._encrypt_value = field._encrypt_value
+        self._charset = field.charset
+        self.decrypt = field._decrypt_value
+
+    def encrypt(self, value):
+        if isinstance(value, six.text_type):
+            value = value.encode(self._charset)
+        elif not isinstance(value, bytes):
+            # Stringify non-string values (ints, decimals, dates) the same way
+            # encrypt_many and get_db_prep_save do.
+            value = force_bytes(value, self._charset)
+        return self._encrypt_value(value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
 
 
 class BaseEncryptedField (models.Field):
@@ -21,20 +122,26 @@ class BaseEncryptedField (models.Field):
         valid_ciphers = getattr(settings, 'PGCRYPTO_VALID_CIPHERS', ('AES', 'Blowfish'))
         self.cipher_name = kwargs.pop('cipher', getattr(settings, 'PGCRYPTO_DEFAULT_CIPHER', 'AES'))
         assert self.cipher_name in valid_ciphers
-        self.cipher_key = kwargs.pop('key', getattr(settings, 'PGCRYPTO_DEFAULT_KEY', ''))
+        self.cipher_mode = kwargs.pop('mode', getattr(settings, 'PGCRYPTO_DEFAULT_MODE', 'CBC'))
+        assert self.cipher_mode in ('CBC', 'GCM')
+        # GCM is an AES-only mode.
+        assert self.cipher_mode == 'CBC' or self.cipher_name == 'AES'
+        self.raw_bytea = kwargs.pop('raw_bytea', getattr(settings, 'PGCRYPTO_RAW_BYTEA', False))
         self.charset = kwargs.pop('charset', 'utf-8')
-        if self.cipher_name == 'AES':
-            if isinstance(self.cipher_key, six.text_type):
-                self.cipher_key = self.cipher_key.encode(self.charset)
-            self.cipher_key = aes_pad_key(self.cipher_key)
-        mod = __import__('Cryptodome.Cipher', globals(), locals(), [self.cipher_name], 0)
-        self.cipher_class = getattr(mod, self.cipher_name)
+        try:
+            self.cipher_class = _CIPHER_CLASSES[self.cipher_name]
+        except KeyError:
+            # PGCRYPTO_VALID_CIPHERS may allow ciphers beyond the built-in table.
+            mod = __import__('Cryptodome.Cipher', globals(), locals(), [self.cipher_name], 0)
+            self.cipher_class = getattr(mod, self.cipher_name)
         self.check_armor = kwargs.pop('check_armor', True)
         self.versioned = kwargs.pop('versioned', False)
+        self._last_raw_key = None
+        self.cipher_key = kwargs.pop('key', getattr(settings, 'PGCRYPTO_DEFAULT_KEY', ''))
         super(BaseEncryptedField, self).__init__(*args, **kwargs)
 
     def get_internal_type(self):
-        return 'TextField'
+        return 'BinaryField' if self.raw_bytea else 'TextField'
 
     def south_field_triple(self):
         """
@@ -52,25 +159,187 @@ class BaseEncryptedField (models.Field):
         kwargs.update({
             #'key': self.cipher_key,
             'cipher': self.cipher_name,
+            'mode': self.cipher_mode,
+            'raw_bytea': self.raw_bytea,
             'charset': self.charset,
             'check_armor': self.check_armor,
             'versioned': self.versioned,
         })
         return name, path, args, kwargs
 
+    @property
+    def cipher_key(self):
+        return self._cipher_key
+
+    @cipher_key.setter
+    def cipher_key(self, key):
+        """
+        Derive (and for AES, pad) the actual cipher key from the given raw key,
+        skipping the whole derivation when the raw key is unchanged.
+        """
+        if self._last_raw_key is not None and key == self._last_raw_key:
+            return
+        self._last_raw_key = key
+        if self.cipher_name == 'AES':
+            cache_key = (key, self.charset)
+            try:
+                key = _AES_KEY_CACHE[cache_key]
+            except KeyError:
+                if isinstance(key, six.text_type):
+                    key = key.encode(self.charset)
+                key = aes_pad_key(key)
+                if len(_AES_KEY_CACHE) >= _AES_KEY_CACHE_SIZE:
+                    _AES_KEY_CACHE.pop(next(iter(_AES_KEY_CACHE)))
+                _AES_KEY_CACHE[cache_key] = key
+        self._cipher_key = key
+        self._build_cipher_factory()
+
+    def _build_cipher_factory(self):
+        """
+        Bind the key, mode, and zeroed IV into a cached factory, so per-call setup
+        is reduced to a single cipher object construction (or a shared EVP context
+        when the cryptography backend is selected). This must be rebuilt whenever
+        the key changes.
+        """
+        if self.cipher_mode == 'GCM':
+            # GCM handles its own per-message nonces; there is no reusable
+            # fixed-IV factory to build.
+            self._cipher_factory = None
+            self._build_crypto_closures()
+            return
+        backend = getattr(settings, 'PGCRYPTO_BACKEND', 'pycryptodome')
+        if backend == 'cryptography':
+            if _EVP_ALGORITHMS is None:
+                raise ImproperlyConfigured("PGCRYPTO_BACKEND = 'cryptography' requires the cryptography package.")
+            try:
+                algorithm_class = _EVP_ALGORITHMS[self.cipher_name]
+            except KeyError:
+                raise ImproperlyConfigured(
+                    "The installed cryptography package does not support %s." % self.cipher_name)
+            block_size = self.cipher_class.block_size
+            zero_iv = _ZERO_IVS.get(block_size) or b'\0' * block_size
+            algorithm = algorithm_class(self.cipher_key)
+            evp_cipher = EVPCipher(algorithm, evp_modes.CBC(zero_iv), backend=default_backend())
+            cipher = _EVPCipherAdapter(evp_cipher)
+            self._cipher_factory = lambda: cipher
+        else:
+            block_size = self.cipher_class.block_size
+            zero_iv = _ZERO_IVS.get(block_size) or b'\0' * block_size
+            self._cipher_factory = functools.partial(
+                self.cipher_class.new, self.cipher_key, self.cipher_class.MODE_CBC, zero_iv)
+        self._build_crypto_closures()
+
+    def _build_crypto_closures(self):
+        """
+        Specialize the encrypt/decrypt pipelines into closures with all the
+        per-field constants (cipher factory, block size, charset, armor options)
+        bound as locals, so each call skips the instance attribute lookups
+        entirely. Rebuilt together with the cipher factory when the key changes.
+        """
+        if self.cipher_mode == 'GCM':
+            encrypt_value, decrypt_value = self._make_gcm_closures()
+        else:
+            encrypt_value, decrypt_value = self._make_cbc_closures()
+        self._encrypt_value = encrypt_value
+        # Columns often repeat the same armored value (enums, flags, shared
+        # dates); an LRU cache turns those decrypts into a dict lookup. Since
+        # the closures are rebuilt on key change, the cache is invalidated
+        # along with them. Set PGCRYPTO_DECRYPT_CACHE = 0 to disable.
+        cache_size = getattr(settings, 'PGCRYPTO_DECRYPT_CACHE', 1024)
+        if cache_size and hasattr(functools, 'lru_cache'):
+            decrypt_value = functools.lru_cache(maxsize=cache_size)(decrypt_value)
+        self._decrypt_value = decrypt_value
+
+    def _make_cbc_closures(self):
+        new_cipher = self._cipher_factory
+        block_size = self.cipher_class.block_size
+        charset = self.charset
+        check_armor = self.check_armor
+        versioned = self.versioned
+        unpad_fn, armor_fn, dearmor_fn = unpad, armor, dearmor
+
+        if self.raw_bytea:
+            def encrypt_value(value):
+                # Pad the bytestring in place (pad_inplace, inlined to spare a
+                # Python frame) and encrypt it; the raw ciphertext goes into a
+                # bytea column with no armor pass.
+                buf = bytearray(value)
+                num = block_size - (len(buf) % block_size)
+                buf.extend(bytes((num,)) * num)
+                return new_cipher().encrypt(buf)
+
+            def decrypt_value(value):
+                # Decrypt the raw (possibly memoryview) value, unpad it, and
+                # decode it to a unicode string.
+                return unpad_fn(new_cipher().decrypt(bytes(value)), block_size).decode(charset)
+        else:
+            def encrypt_value(value):
+                # Pad the bytestring in place (pad_inplace, inlined to spare a
+                # Python frame), encrypt it, and armor it for text storage. The
+                # cipher accepts the bytearray via the buffer protocol, so no
+                # extra full-size copy is made for the padding.
+                buf = bytearray(value)
+                num = block_size - (len(buf) % block_size)
+                buf.extend(bytes((num,)) * num)
+                return armor_fn(new_cipher().encrypt(buf), versioned=versioned)
+
+            def decrypt_value(value):
+                # De-armor the value, decrypt it, unpad it, and decode it to a unicode string.
+                return unpad_fn(new_cipher().decrypt(dearmor_fn(value, verify=check_armor)), block_size).decode(charset)
+
+        return encrypt_value, decrypt_value
+
+    def _make_gcm_closures(self):
+        """
+        AES-GCM fuses encryption and authentication into a single pass over
+        the data and needs no padding. Each message gets a fresh random
+        12-byte nonce, stored with the 16-byte authentication tag as
+        nonce + tag + ciphertext inside the usual armor. Note that pgcrypto's
+        SQL-side decrypt cannot read these values, so GCM is only for
+        deployments that access the column exclusively through these fields.
+        """
+        key = self.cipher_key
+        aes = self.cipher_class
+        mode_gcm = aes.MODE_GCM
+        urandom = os.urandom
+        charset = self.charset
+        check_armor = self.check_armor
+        versioned = self.versioned
+        armor_fn, dearmor_fn = armor, dearmor
+        raw_bytea = self.raw_bytea
+
+        def encrypt_value(value):
+            nonce = urandom(12)
+            ciphertext, tag = aes.new(key, mode_gcm, nonce=nonce).encrypt_and_digest(value)
+            payload = nonce + tag + ciphertext
+            return payload if raw_bytea else armor_fn(payload, versioned=versioned)
+
+        def decrypt_value(value):
+            data = bytes(value) if raw_bytea else dearmor_fn(value, verify=check_armor)
+            nonce, tag, ciphertext = data[:12], data[12:28], data[28:]
+            return aes.new(key, mode_gcm, nonce=nonce).decrypt_and_verify(ciphertext, tag).decode(charset)
+
+        return encrypt_value, decrypt_value
+
     def get_cipher(self):
         """
         Return a new Cipher object for each time we want to encrypt/decrypt. This is because
         pgcrypto expects a zeroed block for IV (initial value), but the IV on the cipher
         object is cumulatively updated each time encrypt/decrypt is called.
         """
-        return self.cipher_class.new(self.cipher_key, self.cipher_class.MODE_CBC, b'\0' * self.cipher_class.block_size)
+        return self._cipher_factory()
 
     def is_encrypted(self, value):
         """
         Returns whether the given value is encrypted (and armored) or not.
+        In raw bytea mode there is no armor to sniff, so any binary value is
+        taken to be ciphertext (plaintext arrives as text from Python). In
+        armored mode only text counts: the armor parsing operates on strings,
+        so bytes pass through untouched, as they always have.
         """
-        return isinstance(value, six.string_types) and value.startswith('-----BEGIN')
+        if self.raw_bytea:
+            return isinstance(value, (bytes, memoryview))
+        return isinstance(value, six.text_type) and value[:10] == _ARMOR_PREFIX
 
     def to_python(self, value):
         if self.is_encrypted(value):
@@ -79,12 +348,50 @@ class BaseEncryptedField (models.Field):
             #    2. Decrypt the bytestring using the specified cipher.
             #    3. Unpad the bytestring using the cipher's block size.
             #    4. Decode the bytestring to a unicode string using the specified charset.
-            dearmored = dearmor(value, verify=self.check_armor)
-            decrypted = self.get_cipher().decrypt(dearmored)
-            unpadded = unpad(decrypted, self.cipher_class.block_size).decode(self.charset)
-            return unpadded
+            return self._decrypt_value(value)
         return value
 
+    def session(self):
+        """
+        Return a CipherSession bound to this field's current key, exposing
+        encrypt/decrypt for processing many values with the setup paid once:
+
+            with field.session() as session:
+                armored = [session.encrypt(v) for v in values]
+        """
+        return CipherSession(self)
+
+    def decrypt_many(self, values):
+        """
+        Decrypt an iterable of armored values in a single pass, yielding the
+        decoded plaintext strings. Per-value overhead is kept to a minimum by
+        hoisting the cipher setup and attribute lookups out of the loop; values
+        that are not armored (e.g. None) are yielded unchanged.
+        """
+        decrypt_value = self._decrypt_value
+        is_encrypted = self.is_encrypted
+        for value in values:
+            yield decrypt_value(value) if is_encrypted(value) else value
+
+    def encrypt_many(self, values):
+        """
+        Encrypt an iterable of values in a single pass, yielding the armored
+        text for each. The write-side counterpart of decrypt_many; values that
+        are empty or already armored are yielded unchanged.
+        """
+        encrypt_value = self._encrypt_value
+        is_encrypted = self.is_encrypted
+        charset = self.charset
+        for value in values:
+            if not value or is_encrypted(value):
+                yield value
+            elif isinstance(value, six.text_type):
+                yield encrypt_value(value.encode(charset))
+            elif isinstance(value, bytes):
+                yield encrypt_value(value)
+            else:
+                yield encrypt_value(force_bytes(value, charset))
+
     def from_db_value(self, value, expression, connection, context):
         return self.to_python(value)
 
@@ -96,10 +403,12 @@ class BaseEncryptedField (models.Field):
             #    3. Pad the bytestring for encryption, using the cipher's block size.
             #    4. Encrypt the padded bytestring using the specified cipher.
             #    5. Armor the encrypted bytestring for storage in the text field.
-            padded = pad(force_bytes(value, self.charset),
-                        self.cipher_class.block_size)
-            encrypted = self.get_cipher().encrypt(padded)
-            return armor(encrypted, versioned=self.versioned)
+            if isinstance(value, six.text_type):
+                # The common case; skip force_bytes' type-dispatch chain.
+                value = value.encode(self.charset)
+            elif not isinstance(value, bytes):
+                value = force_bytes(value, self.charset)
+            return self._encrypt_value(value)
         return value
 
 
@@ -138,6 +447,8 @@ class EncryptedIntegerField (BaseEncryptedField):
         return super(EncryptedIntegerField, self).formfield(**defaults)
 
     def to_python(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
         if value:
             return int(super(EncryptedIntegerField, self).to_python(value))
         return value
@@ -153,6 +464,8 @@ class EncryptedDecimalField (BaseEncryptedField):
         return super(EncryptedDecimalField, self).formfield(**defaults)
 
     def to_python(self, value):
+        if isinstance(value, decimal.Decimal):
+            return value
         if value:
             return decimal.Decimal(super(EncryptedDecimalField, self).to_python(value))
         return value
@@ -161,6 +474,11 @@ class EncryptedDecimalField (BaseEncryptedField):
 class EncryptedDateField (BaseEncryptedField):
     description = _('Date (without time)')
     field_cast = '::date'
+    # The exact type _parse_value produces; already-parsed values short-circuit.
+    parsed_type = datetime.date
+    # A single shared parser instance; constructing a Django field per parse
+    # costs far more than the parse itself.
+    parser = models.DateField()
 
     def __init__(self, verbose_name=None, name=None, auto_now=False, auto_now_add=False, **kwargs):
         self.auto_now, self.auto_now_add = auto_now, auto_now_add
@@ -177,6 +495,10 @@ class EncryptedDateField (BaseEncryptedField):
     def to_python(self, value):
         if value in self.empty_values:
             return None
+        if type(value) is self.parsed_type:
+            # An exact type check, so e.g. a datetime still gets truncated
+            # to a date by _parse_value below.
+            return value
         unencrypted_value = super(EncryptedDateField, self).to_python(value)
         return self._parse_value(unencrypted_value)
 
@@ -193,7 +515,7 @@ class EncryptedDateField (BaseEncryptedField):
             return super(EncryptedDateField, self).pre_save(model_instance, add)
 
     def _parse_value(self, value):
-        return models.DateField().to_python(value)
+        return self.parser.to_python(value)
 
     def _get_auto_now_value(self):
         return datetime.date.today()
@@ -202,15 +524,14 @@ class EncryptedDateField (BaseEncryptedField):
 class EncryptedDateTimeField (EncryptedDateField):
     description = _('Date (with time)')
     field_cast = 'timestamp with time zone'
+    parsed_type = datetime.datetime
+    parser = models.DateTimeField()
 
     def formfield(self, **kwargs):
         defaults = {'widget': forms.DateTimeInput}
         defaults.update(kwargs)
         return super(EncryptedDateTimeField, self).formfield(**defaults)
 
-    def _parse_value(self, value):
-        return models.DateTimeField().to_python(value)
-
     def _get_auto_now_value(self):
         return timezone.now()
 
@@ -225,9 +546,49 @@ class EncryptedEmailField (BaseEncryptedField):
         return super(EncryptedEmailField, self).formfield(**defaults)
 
 
+def decrypt_column(queryset, field_name):
+    """
+    Decrypt a single encrypted column for a whole queryset in one batch,
+    returning a list of decoded plaintext strings. The raw armored values are
+    fetched with a cast to text, so the per-row from_db_value machinery is
+    bypassed entirely in favor of one decrypt_many pass.
+    """
+    field = queryset.model._meta.get_field(field_name)
+    output_field = models.BinaryField() if field.raw_bytea else models.TextField()
+    raw_values = queryset.annotate(
+        _raw_value=Cast(field_name, output_field),
+    ).values_list('_raw_value', flat=True)
+    return list(field.decrypt_many(raw_values))
+
+
 if django.VERSION >= (1, 7):
 
-    from django.db.models.lookups import Lookup
+    from django.db.models.lookups import In, Lookup
+
+    _decrypt_sql_templates = {}
+
+    def _decrypt_sql(field):
+        """
+        Build (and memoize) the SQL template that decrypts an encrypted column
+        to its comparable form, with the pgcrypto cipher name and field cast
+        baked in. Two slots remain per query: the column reference and the
+        comparison clause.
+        """
+        key = (field.cipher_name, field.field_cast, field.raw_bytea)
+        try:
+            return _decrypt_sql_templates[key]
+        except KeyError:
+            cipher = {
+                'AES': 'aes',
+                'Blowfish': 'bf',
+            }[field.cipher_name]
+            # Raw bytea columns hold the ciphertext directly, so there is no
+            # armor for the server to strip (saving a base64 pass per row).
+            # Note this is a format argument, inserted verbatim: the column
+            # slot needs a single %s to survive into the memoized template.
+            column = '%s' if field.raw_bytea else 'dearmor(%s)'
+            template = "convert_from(decrypt(%s, %%%%s, '%s'), 'utf-8')%s %%s" % (column, cipher, field.field_cast)
+            return _decrypt_sql_templates.setdefault(key, template)
 
     class EncryptedLookup (Lookup):
 
@@ -236,12 +597,26 @@ if django.VERSION >= (1, 7):
             rhs, rhs_params = self.process_rhs(qn, connection)
             params = lhs_params + [self.lhs.output_field.cipher_key] + rhs_params
             rhs = connection.operators[self.lookup_name] % rhs
-            cipher = {
-                'AES': 'aes',
-                'Blowfish': 'bf',
-            }[self.lhs.output_field.cipher_name]
-            return "convert_from(decrypt(dearmor(%s), %%s, '%s'), 'utf-8')%s %s" % \
-                (lhs, cipher, self.lhs.output_field.field_cast, rhs), params
+            return _decrypt_sql(self.lhs.output_field) % (lhs, rhs), params
+
+    class EncryptedLookupIn (In):
+        """
+        An __in lookup against the decrypted column. Built on Django's In so
+        the right-hand side placeholder list is handled for us; only the
+        left-hand side decryption SQL differs.
+        """
+
+        def as_postgresql(self, qn, connection):
+            lhs, lhs_params = self.process_lhs(qn, connection)
+            rhs, rhs_params = self.process_rhs(qn, connection)
+            # batch_process_rhs returns rhs_params as a tuple, so build the
+            # params list with extend rather than concatenation.
+            params = list(lhs_params)
+            params.append(self.lhs.output_field.cipher_key)
+            params.extend(rhs_params)
+            return _decrypt_sql(self.lhs.output_field) % (lhs, 'IN ' + rhs), params
+
+    BaseEncryptedField.register_lookup(EncryptedLookupIn)
 
     for lookup_name in ('exact', 'gt', 'gte', 'lt', 'lte'):
         class_name = 'EncryptedLookup_%s' % lookup_name
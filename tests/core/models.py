@@ -8,6 +8,7 @@ import pgcrypto
 class Employee (models.Model):
     name = models.CharField(max_length=200)
     ssn = pgcrypto.EncryptedCharField('SSN')
+    ssn_raw = pgcrypto.EncryptedCharField('SSN (raw)', raw_bytea=True, null=True)
     salary = pgcrypto.EncryptedDecimalField()
     date_hired = pgcrypto.EncryptedDateField(cipher='Blowfish', key=b'datekey')
     email = pgcrypto.EncryptedEmailField(unique=True, null=True)
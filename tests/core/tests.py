@@ -5,9 +5,11 @@ from django.db.utils import IntegrityError
 from django.test import TestCase
 
 from pgcrypto import aes_pad_key, armor, dearmor, pad, unpad
+import pgcrypto
 
 from .models import Employee
 
+import datetime
 import decimal
 import json
 import os
@@ -41,10 +43,31 @@ class CryptoTests (unittest.TestCase):
         c = Blowfish.new(b'passw', Blowfish.MODE_CBC, self.iv_blowfish)
         self.assertEqual(unpad(c.decrypt(self.encrypt_bf), c.block_size), b'sensitive information')
 
+    def test_pad_inplace(self):
+        from pgcrypto import pad_inplace
+        for data in (b'sensitive information', b'x' * 16, b''):
+            for zero in (False, True):
+                buf = bytearray(data)
+                self.assertIs(pad_inplace(buf, 16, zero=zero), buf)
+                self.assertEqual(bytes(buf), pad(data, 16, zero=zero))
+
     def test_armor_dearmor(self):
         a = armor(self.encrypt_bf)
         self.assertEqual(dearmor(a), self.encrypt_bf)
 
+    def test_dearmor_wrapped(self):
+        # pgcrypto wraps the base64 body at 76 characters; make sure a
+        # multi-line body (with its own checksum) still dearmors correctly.
+        import base64
+        import struct
+        from pgcrypto.base import crc24
+        data = self.encrypt_aes * 8
+        body = base64.b64encode(data).decode('ascii')
+        wrapped = '\n'.join(body[i:i + 76] for i in range(0, len(body), 76))
+        crc = base64.b64encode(struct.pack('>L', crc24(data))[1:]).decode('ascii')
+        a = '-----BEGIN PGP MESSAGE-----\n\n%s\n=%s\n-----END PGP MESSAGE-----' % (wrapped, crc)
+        self.assertEqual(dearmor(a), data)
+
     def test_aes(self):
         c = AES.new(aes_pad_key(b'pass'), AES.MODE_CBC, self.iv_aes)
         self.assertEqual(c.encrypt(pad(b'sensitive information', c.block_size)), self.encrypt_aes)
@@ -54,6 +77,132 @@ class CryptoTests (unittest.TestCase):
         self.assertEqual(unpad(c.decrypt(self.encrypt_aes_padded), c.block_size), b'xxxxxxxxxxxxxxxx')
 
 
+class FieldCryptoTests (unittest.TestCase):
+    """
+    Exercises the fields' encryption pipelines directly; no database needed.
+    """
+
+    def test_gcm_round_trip(self):
+        f = pgcrypto.EncryptedCharField(key=b'secret', mode='GCM')
+        enc = f.get_db_prep_save('sensitive information', None)
+        self.assertTrue(enc.startswith('-----BEGIN PGP MESSAGE-----'))
+        self.assertEqual(f.to_python(enc), 'sensitive information')
+
+    def test_gcm_nonce_uniqueness(self):
+        # Unlike the fixed-IV CBC mode, each GCM message gets a fresh nonce,
+        # so encrypting the same plaintext twice yields different ciphertext.
+        f = pgcrypto.EncryptedCharField(key=b'secret', mode='GCM')
+        self.assertNotEqual(
+            f.get_db_prep_save('sensitive information', None),
+            f.get_db_prep_save('sensitive information', None))
+
+    def test_gcm_tamper_detection(self):
+        f = pgcrypto.EncryptedCharField(key=b'secret', mode='GCM')
+        enc = f.get_db_prep_save('sensitive information', None)
+        data = bytearray(dearmor(enc))
+        data[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            f.to_python(armor(bytes(data)))
+        # A flipped bit in the tag fails too.
+        data = bytearray(dearmor(enc))
+        data[12] ^= 0x01
+        with self.assertRaises(ValueError):
+            f.to_python(armor(bytes(data)))
+
+    def test_gcm_requires_aes(self):
+        with self.assertRaises(AssertionError):
+            pgcrypto.EncryptedCharField(cipher='Blowfish', key=b'secret', mode='GCM')
+
+    def test_armored_bytes_pass_through(self):
+        # In armored (text) mode the decrypt pipeline is str-only, so bytes
+        # must never be classified as encrypted; they pass through unchanged.
+        f = pgcrypto.EncryptedCharField(key=b'secret')
+        enc = f.get_db_prep_save('sensitive information', None).encode('ascii')
+        self.assertFalse(f.is_encrypted(enc))
+        self.assertEqual(f.to_python(enc), enc)
+
+    def test_raw_bytea_round_trip(self):
+        for mode in ('CBC', 'GCM'):
+            f = pgcrypto.EncryptedCharField(key=b'secret', raw_bytea=True, mode=mode)
+            self.assertEqual(f.get_internal_type(), 'BinaryField')
+            enc = f.get_db_prep_save('sensitive information', None)
+            self.assertIsInstance(enc, bytes)
+            self.assertEqual(f.to_python(enc), 'sensitive information')
+            # psycopg2 returns memoryviews for bytea columns.
+            self.assertEqual(f.to_python(memoryview(enc)), 'sensitive information')
+
+    def test_raw_bytea_matches_dearmored(self):
+        # Raw CBC ciphertext is byte-identical to the dearmored payload of the
+        # default armored mode.
+        raw = pgcrypto.EncryptedCharField(key=b'secret', raw_bytea=True)
+        armored = pgcrypto.EncryptedCharField(key=b'secret')
+        self.assertEqual(
+            raw.get_db_prep_save('sensitive information', None),
+            dearmor(armored.get_db_prep_save('sensitive information', None)))
+
+    def test_cryptography_backend_parity(self):
+        from pgcrypto.fields import _EVP_ALGORITHMS
+        if not _EVP_ALGORITHMS:
+            self.skipTest('cryptography is not installed')
+        from django.test import override_settings
+        with override_settings(PGCRYPTO_BACKEND='cryptography'):
+            evp = pgcrypto.EncryptedCharField(key=b'secret')
+            enc = evp.get_db_prep_save('sensitive information', None)
+            self.assertEqual(evp.to_python(enc), 'sensitive information')
+            if 'Blowfish' in _EVP_ALGORITHMS:
+                bf = pgcrypto.EncryptedCharField(cipher='Blowfish', key=b'datekey')
+                enc_bf = bf.get_db_prep_save('sensitive information', None)
+        # Same key/IV/mode: the armored output must be byte-identical to the
+        # default Cryptodome backend, both ways.
+        default = pgcrypto.EncryptedCharField(key=b'secret')
+        self.assertEqual(enc, default.get_db_prep_save('sensitive information', None))
+        self.assertEqual(default.to_python(enc), 'sensitive information')
+        if 'Blowfish' in _EVP_ALGORITHMS:
+            default_bf = pgcrypto.EncryptedCharField(cipher='Blowfish', key=b'datekey')
+            self.assertEqual(enc_bf, default_bf.get_db_prep_save('sensitive information', None))
+
+    def test_session(self):
+        f = pgcrypto.EncryptedCharField(key=b'secret')
+        with f.session() as session:
+            enc = session.encrypt('sensitive information')
+            self.assertEqual(enc, f.get_db_prep_save('sensitive information', None))
+            self.assertEqual(session.decrypt(enc), 'sensitive information')
+        # Non-string values are stringified like get_db_prep_save does.
+        for field, value in (
+                (pgcrypto.EncryptedIntegerField(key=b'secret'), 42),
+                (pgcrypto.EncryptedDecimalField(key=b'secret'), decimal.Decimal('75248.77')),
+                (pgcrypto.EncryptedDateField(key=b'secret'), datetime.date(1999, 1, 23))):
+            with field.session() as session:
+                enc = session.encrypt(value)
+                self.assertEqual(enc, field.get_db_prep_save(value, None))
+                self.assertEqual(field.to_python(enc), value)
+
+    def test_in_lookup_sql_compilation(self):
+        # Compile an __in lookup without touching the database; Django's batch
+        # processing hands the rhs params back as a tuple, which the params
+        # assembly must tolerate.
+        qs = Employee.objects.filter(salary__in=[decimal.Decimal('1.00'), decimal.Decimal('2.00')])
+        compiler = qs.query.get_compiler(qs.db)
+        lookup = qs.query.where.children[0]
+        sql, params = lookup.as_postgresql(compiler, compiler.connection)
+        self.assertEqual(
+            sql,
+            "convert_from(decrypt(dearmor(\"core_employee\".\"salary\"), %s, 'aes'), 'utf-8')::numeric IN (%s, %s)")
+        self.assertEqual(params[0], Employee._meta.get_field('salary').cipher_key)
+        self.assertEqual(len(params), 3)
+
+    def test_lookup_sql_templates(self):
+        from pgcrypto.fields import _decrypt_sql
+        f = pgcrypto.EncryptedDecimalField(key=b'secret')
+        self.assertEqual(
+            _decrypt_sql(f) % ('"t"."c"', '= %s'),
+            "convert_from(decrypt(dearmor(\"t\".\"c\"), %s, 'aes'), 'utf-8')::numeric = %s")
+        raw = pgcrypto.EncryptedCharField(key=b'secret', raw_bytea=True)
+        self.assertEqual(
+            _decrypt_sql(raw) % ('"t"."c"', 'IN (%s, %s)'),
+            "convert_from(decrypt(\"t\".\"c\", %s, 'aes'), 'utf-8') IN (%s, %s)")
+
+
 class FieldTests (TestCase):
     fixtures = ('employees',)
 
@@ -87,6 +236,25 @@ class FieldTests (TestCase):
     def test_multi_lookups(self):
         self.assertEqual(Employee.objects.filter(date_hired__gt='1981-01-01', salary__lt=60000).count(), 1)
 
+    def test_raw_bytea_lookups(self):
+        Employee.objects.create(
+            name='Raw Storage', date_hired='2000-01-01',
+            email='raw.storage@example.com', ssn_raw='123-45-6789')
+        e = Employee.objects.get(ssn_raw='123-45-6789')
+        self.assertEqual(e.ssn_raw, '123-45-6789')
+        self.assertEqual(Employee.objects.filter(ssn_raw='123-45-6789').count(), 1)
+        self.assertEqual(Employee.objects.filter(ssn_raw__in=['123-45-6789', '000-00-0000']).count(), 1)
+
+    def test_in_lookups(self):
+        self.assertEqual(Employee.objects.filter(salary__in=[decimal.Decimal('75248.77')]).count(), 1)
+        self.assertEqual(Employee.objects.filter(salary__in=[decimal.Decimal('1.00')]).count(), 0)
+        self.assertEqual(Employee.objects.filter(date_hired__in=['1999-01-23', '1996-02-28']).count(), 2)
+
+    def test_decrypt_column(self):
+        from pgcrypto.fields import decrypt_column
+        qs = Employee.objects.order_by('pk')
+        self.assertEqual(decrypt_column(qs, 'ssn'), [e.ssn for e in qs])
+
     def test_model_validation(self):
         obj = Employee(name='Invalid User', date_hired='2000-01-01', email='invalid')
         try: